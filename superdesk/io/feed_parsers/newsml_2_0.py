@@ -9,10 +9,14 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 
+import re
 import arrow
 import datetime
 import logging
 
+from functools import lru_cache
+from lxml import etree
+
 from superdesk.errors import ParserError
 from superdesk.io.registry import register_feed_parser
 from superdesk.io.feed_parsers import XMLFeedParser
@@ -23,8 +27,79 @@ from superdesk.metadata.utils import is_normal_package
 XMLNS = 'http://iptc.org/std/nar/2006-10-01/'
 XHTML = 'http://www.w3.org/1999/xhtml'
 
+NS = {'nar': XMLNS}
+
+# Clark-notation tags precomputed once, so find/findall compare against
+# an already interned string instead of rebuilding it per call
+_TAG_HEADER = '{%s}header' % XMLNS
+_TAG_PRIORITY = '{%s}priority' % XMLNS
+_TAG_ITEMSET = '{%s}itemSet' % XMLNS
+_TAG_ITEMMETA = '{%s}itemMeta' % XMLNS
+_TAG_ITEMCLASS = '{%s}itemClass' % XMLNS
+_TAG_VERSIONCREATED = '{%s}versionCreated' % XMLNS
+_TAG_FIRSTCREATED = '{%s}firstCreated' % XMLNS
+_TAG_PUBSTATUS = '{%s}pubStatus' % XMLNS
+_TAG_EDNOTE = '{%s}edNote' % XMLNS
+_TAG_CONTENTMETA = '{%s}contentMeta' % XMLNS
+_TAG_URGENCY = '{%s}urgency' % XMLNS
+_TAG_SLUGLINE = '{%s}slugline' % XMLNS
+_TAG_HEADLINE = '{%s}headline' % XMLNS
+_TAG_BY = '{%s}by' % XMLNS
+_TAG_DESCRIPTION = '{%s}description' % XMLNS
+_TAG_LANGUAGE = '{%s}language' % XMLNS
+_TAG_INFOSOURCE = '{%s}infoSource' % XMLNS
+_TAG_GENRE = '{%s}genre' % XMLNS
+_TAG_NAME = '{%s}name' % XMLNS
+_TAG_SUBJECT = '{%s}subject' % XMLNS
+_TAG_BROADER = '{%s}broader' % XMLNS
+_TAG_RIGHTSINFO = '{%s}rightsInfo' % XMLNS
+_TAG_USAGETERMS = '{%s}usageTerms' % XMLNS
+_TAG_GROUPSET = '{%s}groupSet' % XMLNS
+_TAG_CONTENTSET = '{%s}contentSet' % XMLNS
+_TAG_INLINEXML = '{%s}inlineXML' % XMLNS
+_TAG_INLINEDATA = '{%s}inlineData' % XMLNS
+_TAG_HTML = '{%s}html' % XHTML
+_TAG_HTML_BODY = '{%s}body' % XHTML
+
 logger = logging.getLogger(__name__)
 
+# single-pass equivalent of .replace('\n    ', '</p><p>').replace('\n', '<br/>')
+_LINE_BREAKS = re.compile(r'\n    |\n')
+_LINE_BREAK_SUBS = {'\n    ': '</p><p>', '\n': '<br/>'}
+
+
+def _line_break_sub(match: 're.Match') -> str:
+    return _LINE_BREAK_SUBS[match.group(0)]
+
+
+@lru_cache(maxsize=4096)
+def _parse_datetime(string: str) -> datetime.datetime:
+    """Parse a NewsML timestamp.
+
+    The fixed ``%Y-%m-%dT%H:%M:%S.000Z`` format is short-circuited via
+    `fromisoformat`, which is much cheaper than `strptime`; anything else
+    falls back to `strptime` and then arrow. Memoized because feeds repeat
+    identical timestamps across items and renditions.
+    """
+    if string.endswith('.000Z'):
+        if len(string) == 24 and string[10] == 'T' and string[4] == string[7] == '-' \
+                and string[13] == string[16] == ':':
+            # the exact 'YYYY-MM-DDTHH:MM:SS.000Z' layout: direct slicing beats
+            # even fromisoformat, and malformed values fall through below
+            try:
+                return datetime.datetime(int(string[0:4]), int(string[5:7]), int(string[8:10]),
+                                         int(string[11:13]), int(string[14:16]), int(string[17:19]))
+            except ValueError:
+                pass
+        try:
+            return datetime.datetime.fromisoformat(string[:-5])
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.strptime(string, '%Y-%m-%dT%H:%M:%S.000Z')
+    except ValueError:
+        return arrow.get(string).datetime
+
 
 class NewsMLTwoFeedParser(XMLFeedParser):
     """
@@ -35,15 +110,37 @@ class NewsMLTwoFeedParser(XMLFeedParser):
 
     label = 'News ML 2.0 Parser'
 
-    def can_parse(self, xml):
+    # single compiled XPath which fetches all contentMeta children of interest
+    # in one C-level pass, instead of one find/findall per field
+    _XP_CONTENT_META = etree.XPath(
+        './nar:urgency|./nar:slugline|./nar:headline|./nar:by|./nar:description'
+        '|./nar:language|./nar:infoSource|./nar:genre|./nar:subject',
+        namespaces=NS)
+
+    # nested genre name lookup with the language filter pushed into the
+    # XPath predicate, so non-english names never surface in Python
+    _XP_GENRE_NAME_EN = etree.XPath(
+        "./nar:name[starts-with(@xml:lang, 'en')]", namespaces=NS)
+
+    def can_parse(self, xml) -> bool:
         return xml.tag.endswith('newsMessage')
 
-    def parse(self, xml, provider=None):
+    @lru_cache(maxsize=None)
+    def qname(self, tag: str, ns: str = None) -> str:
+        # NewsML-G2 tags always live in the NAR namespace, so the name can be
+        # cached instead of being rebuilt from the root tag on every call
+        if ns is None:
+            ns = XMLNS
+        return super().qname(tag, ns)
+
+    def parse(self, xml, provider: dict = None) -> list:
+        if not hasattr(xml, 'tag'):  # file path or file-like object
+            return self.parse_stream(xml, provider)
         self.root = xml
         items = []
         try:
             header = self.parse_header(xml)
-            for item_set in xml.findall(self.qname('itemSet')):
+            for item_set in xml.findall(_TAG_ITEMSET):
                 for item_tree in item_set:
                     item = self.parse_item(item_tree)
                     item['priority'] = header['priority']
@@ -52,7 +149,37 @@ class NewsMLTwoFeedParser(XMLFeedParser):
         except Exception as ex:
             raise ParserError.newsmlTwoParserError(ex, provider)
 
-    def parse_item(self, tree):
+    def parse_stream(self, source, provider: dict = None) -> list:
+        """Parse NewsML-G2 incrementally from a file path or file-like object.
+
+        Unlike :meth:`parse` this never holds the full document tree in
+        memory - each itemSet is dropped once its items are parsed, so
+        memory stays bound to a single itemSet for multi-MB feeds.
+
+        :param source: file path or file-like object
+        :return: list of items
+        """
+        items = []
+        priority = 5
+        try:
+            for event, elem in etree.iterparse(source, events=('end',), tag=(_TAG_HEADER, _TAG_ITEMSET)):
+                if elem.tag == _TAG_HEADER:
+                    priority = self.map_priority(elem.find(_TAG_PRIORITY).text)
+                else:
+                    self.root = elem.getroottree().getroot()
+                    for item_tree in elem:
+                        item = self.parse_item(item_tree)
+                        item['priority'] = priority
+                        items.append(item)
+                # free the parsed subtree and any already processed siblings
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            return items
+        except Exception as ex:
+            raise ParserError.newsmlTwoParserError(ex, provider)
+
+    def parse_item(self, tree) -> dict:
         item = dict()
         item['guid'] = tree.attrib['guid'] + ':' + tree.attrib['version']
         item['uri'] = tree.attrib['guid']
@@ -69,123 +196,110 @@ class NewsMLTwoFeedParser(XMLFeedParser):
 
         return item
 
-    def parse_header(self, tree):
+    def parse_header(self, tree) -> dict:
         """Parse header element.
 
         :param tree:
         :return: dict
         """
-        header = tree.find(self.qname('header'))
+        header = tree.find(_TAG_HEADER)
         priority = 5
         if header is not None:
-            priority = self.map_priority(header.find(self.qname('priority')).text)
+            priority = self.map_priority(header.find(_TAG_PRIORITY).text)
 
         return {'priority': priority}
 
-    def parse_item_meta(self, tree, item):
+    def parse_item_meta(self, tree, item: dict) -> None:
         """Parse itemMeta tag"""
-        meta = tree.find(self.qname('itemMeta'))
-        item[ITEM_TYPE] = meta.find(self.qname('itemClass')).attrib['qcode'].split(':')[1]
-        item['versioncreated'] = self.datetime(meta.find(self.qname('versionCreated')).text)
-        item['firstcreated'] = self.datetime(meta.find(self.qname('firstCreated')).text)
-        item['pubstatus'] = (meta.find(self.qname('pubStatus')).attrib['qcode'].split(':')[1]).lower()
-        item['ednote'] = meta.find(self.qname('edNote')).text if meta.find(self.qname('edNote')) is not None else ''
-
-    def parse_content_meta(self, tree, item):
+        meta = tree.find(_TAG_ITEMMETA)
+        # one pass over the children instead of a linear find per field -
+        # the itemMeta children read here are unique in NewsML-G2
+        children = {child.tag: child for child in meta}
+        item[ITEM_TYPE] = children[_TAG_ITEMCLASS].attrib['qcode'].partition(':')[2]
+        item['versioncreated'] = self.datetime(children[_TAG_VERSIONCREATED].text)
+        item['firstcreated'] = self.datetime(children[_TAG_FIRSTCREATED].text)
+        item['pubstatus'] = children[_TAG_PUBSTATUS].attrib['qcode'].partition(':')[2].lower()
+        ednote = children.get(_TAG_EDNOTE)
+        item['ednote'] = ednote.text if ednote is not None else ''
+
+    def parse_content_meta(self, tree, item: dict) -> None:
         """Parse contentMeta tag"""
-        meta = tree.find(self.qname('contentMeta'))
-
-        def parse_meta_item_text(key, dest=None, elemTree=None):
-            if dest is None:
-                dest = key
-
-            if elemTree is None:
-                elemTree = meta
+        meta = tree.find(_TAG_CONTENTMETA)
 
-            elem = elemTree.find(self.qname(key))
-            if elem is not None:
-                if dest == 'urgency':
-                    item[dest] = int(elem.text)
-                else:
-                    item[dest] = elem.text
-
-        parse_meta_item_text('urgency')
-        parse_meta_item_text('slugline')
-        parse_meta_item_text('headline')
-        # parse_meta_item_text('creditline')
-        parse_meta_item_text('by', 'byline')
+        item['genre'] = []
+        item['subject'] = []
+        for elem in self._XP_CONTENT_META(meta):
+            tag = elem.tag
+            if tag == _TAG_URGENCY:
+                if 'urgency' not in item:
+                    item['urgency'] = int(elem.text)
+            elif tag == _TAG_SLUGLINE:
+                item.setdefault('slugline', elem.text)
+            elif tag == _TAG_HEADLINE:
+                item.setdefault('headline', elem.text)
+            elif tag == _TAG_BY:
+                item.setdefault('byline', elem.text)
+            elif tag == _TAG_DESCRIPTION:
+                if 'description_text' not in item:
+                    item['description_text'] = elem.text
+                    item['archive_description'] = elem.text
+            elif tag == _TAG_LANGUAGE:
+                if 'language' not in item:
+                    item['language'] = elem.get('tag')
+            elif tag == _TAG_INFOSOURCE:
+                if 'original_source' not in item and elem.get('role', '') == 'cRole:source':
+                    item['original_source'] = elem.get('literal')
+            elif tag == _TAG_GENRE:
+                for name_el in self._XP_GENRE_NAME_EN(elem):
+                    item['genre'].append({'name': name_el.text})
+            elif tag == _TAG_SUBJECT:
+                self.parse_subject(elem, item)
 
         item['slugline'] = item.get('slugline', '')
         item['headline'] = item.get('headline', '')
 
-        try:
-            item['description_text'] = meta.find(self.qname('description')).text
-            item['archive_description'] = item['description_text']
-        except AttributeError:
-            pass
-
-        try:
-            item['language'] = meta.find(self.qname('language')).get('tag')
-        except AttributeError:
-            pass
-
-        self.parse_content_subject(meta, item)
-        self.parse_content_place(meta, item)
-
-        for info_source in meta.findall(self.qname('infoSource')):
-            if info_source.get('role', '') == 'cRole:source':
-                item['original_source'] = info_source.get('literal')
-                break
-
-        item['genre'] = []
-        for genre_el in meta.findall(self.qname('genre')):
-            for name_el in genre_el.findall(self.qname('name')):
-                lang = name_el.get(self.qname("lang", ns='xml'))
-                if lang and lang.startswith('en'):
-                    item['genre'].append({'name': name_el.text})
+    def parse_subject(self, subject, item: dict) -> None:
+        """Classify a single contentMeta subject element.
 
-    def parse_content_subject(self, tree, item):
-        """Parse subj type subjects into subject list."""
-        item['subject'] = []
-        for subject in tree.findall(self.qname('subject')):
-            qcode_parts = subject.get('qcode', '').split(':')
-            if len(qcode_parts) == 2 and qcode_parts[0] == 'subj':
-                try:
-                    item['subject'].append({
-                        'qcode': qcode_parts[1],
-                        'name': subject_codes[qcode_parts[1]]
-                    })
-                except KeyError:
-                    logger.debug("Subject code '%s' not found" % qcode_parts[1])
-
-    def parse_content_place(self, tree, item):
-        """Parse subject with type="cptType:5" into place list."""
-        for subject in tree.findall(self.qname('subject')):
-            if subject.get('type', '') == 'cptType:5':
-                item['place'] = []
-                item['place'].append({'name': self.get_literal_name(subject)})
-                broader = subject.find(self.qname('broader'))
-                if broader is not None:
-                    item['place'].append({'name': self.get_literal_name(broader)})
-
-    def parse_rights_info(self, tree, item):
+        `subj:` qcodes go into the subject list, `cptType:5` subjects into
+        the place list.
+        """
+        scheme, sep, code = subject.get('qcode', '').partition(':')
+        if sep and scheme == 'subj':
+            name = subject_codes.get(code)
+            if name is not None:
+                item['subject'].append({
+                    'qcode': code,
+                    'name': name
+                })
+            else:
+                logger.debug("Subject code '%s' not found" % code)
+        if subject.get('type', '') == 'cptType:5':
+            item['place'] = []
+            item['place'].append({'name': self.get_literal_name(subject)})
+            broader = subject.find(_TAG_BROADER)
+            if broader is not None:
+                item['place'].append({'name': self.get_literal_name(broader)})
+
+    def parse_rights_info(self, tree, item: dict) -> None:
         """Parse Rights Info tag"""
-        info = tree.find(self.qname('rightsInfo'))
+        info = tree.find(_TAG_RIGHTSINFO)
         if info is not None:
-            item['usageterms'] = getattr(info.find(self.qname('usageTerms')), 'text', '')
+            usage_terms = info.find(_TAG_USAGETERMS)
+            item['usageterms'] = usage_terms.text if usage_terms is not None else ''
             # item['copyrightholder'] = info.find(self.qname('copyrightHolder')).attrib['literal']
             # item['copyrightnotice'] = getattr(info.find(self.qname('copyrightNotice')), 'text', None)
 
-    def parse_group_set(self, tree, item):
+    def parse_group_set(self, tree, item: dict) -> None:
         item['groups'] = []
-        for group in tree.find(self.qname('groupSet')):
+        for group in tree.find(_TAG_GROUPSET):
             data = {}
             data['id'] = group.attrib['id']
             data['role'] = group.attrib['role']
             data['refs'] = self.parse_refs(group)
             item['groups'].append(data)
 
-    def parse_refs(self, group_tree):
+    def parse_refs(self, group_tree) -> list:
         refs = []
         for tree in group_tree:
             if 'idref' in tree.attrib:
@@ -197,76 +311,80 @@ class NewsMLTwoFeedParser(XMLFeedParser):
                 else:
                     ref['residRef'] = tree.attrib['residref']
                 ref['contentType'] = tree.attrib['contenttype']
-                ref['itemClass'] = tree.find(self.qname('itemClass')).attrib['qcode']
+                ref['itemClass'] = tree.find(_TAG_ITEMCLASS).attrib['qcode']
 
-                for headline in tree.findall(self.qname('headline')):
+                for headline in tree.findall(_TAG_HEADLINE):
                     ref['headline'] = headline.text
 
                 refs.append(ref)
         return refs
 
-    def parse_content_set(self, tree, item):
+    def parse_content_set(self, tree, item: dict) -> None:
         item['renditions'] = {}
-        for content in tree.find(self.qname('contentSet')):
-            if content.tag == self.qname('inlineXML'):
-                try:
-                    item['word_count'] = int(content.attrib['wordcount'])
-                except KeyError:
-                    pass
+        for content in tree.find(_TAG_CONTENTSET):
+            if content.tag == _TAG_INLINEXML:
+                word_count = content.attrib.get('wordcount')
+                if word_count is not None:
+                    item['word_count'] = int(word_count)
                 content = self.parse_inline_content(content)
                 item['body_html'] = content.get('content')
                 if 'format' in content:
                     item['format'] = content.get('format')
-            elif content.tag == self.qname('inlineData'):
+            elif content.tag == _TAG_INLINEDATA:
                 item['body_html'] = content.text
-                try:
-                    item['word_count'] = int(content.attrib['wordcount'])
-                except KeyError:
-                    pass
+                word_count = content.attrib.get('wordcount')
+                if word_count is not None:
+                    item['word_count'] = int(word_count)
             else:
                 rendition = self.parse_remote_content(content)
                 item['renditions'][rendition['rendition']] = rendition
 
-    def parse_inline_content(self, tree, ns=XHTML):
-        html = tree.find(self.qname('html', ns))
-        body = html.find(self.qname('body', ns))
-        elements = []
+    def parse_inline_content(self, tree, ns: str = XHTML) -> dict:
+        html = tree.find(_TAG_HTML if ns == XHTML else self.qname('html', ns))
+        body = html.find(_TAG_HTML_BODY if ns == XHTML else self.qname('body', ns))
+        parts = []
+        append = parts.append
+        count = 0
         for elem in body:
             if elem.text:
-                tag = elem.tag.rsplit('}')[1]
-                elements.append('<%s>%s</%s>' % (tag, elem.text, tag))
-
-        # If there is a single p tag then replace the line feeds with breaks
-        if len(elements) == 1 and body[0].tag.rsplit('}')[1] == 'p':
-            elements[0] = elements[0].replace('\n    ', '</p><p>').replace('\n', '<br/>')
+                tag = etree.QName(elem).localname
+                append('<')
+                append(tag)
+                append('>')
+                append(elem.text)
+                append('</')
+                append(tag)
+                append('>\n')
+                count += 1
 
         content = dict()
         content['contenttype'] = tree.attrib['contenttype']
-        if len(elements) > 0:
-            content['content'] = "\n".join(elements)
+        if count:
+            joined = ''.join(parts)[:-1]  # drop the trailing separator
+            # If there is a single p tag then replace the line feeds with breaks
+            if count == 1 and etree.QName(body[0]).localname == 'p':
+                joined = _LINE_BREAKS.sub(_line_break_sub, joined)
+            content['content'] = joined
         elif body.text:
             content['content'] = '<pre>' + body.text + '</pre>'
             content['format'] = CONTENT_TYPE.PREFORMATTED
         return content
 
-    def parse_remote_content(self, tree):
+    def parse_remote_content(self, tree) -> dict:
         content = dict()
         content['residRef'] = tree.attrib.get('residref')
         content['sizeinbytes'] = int(tree.attrib.get('size', '0'))
-        content['rendition'] = tree.attrib['rendition'].split(':')[1]
+        content['rendition'] = tree.attrib['rendition'].partition(':')[2]
         content['mimetype'] = tree.attrib['contenttype']
         content['href'] = tree.attrib.get('href', None)
         return content
 
-    def datetime(self, string):
-        try:
-            return datetime.datetime.strptime(string, '%Y-%m-%dT%H:%M:%S.000Z')
-        except ValueError:
-            return arrow.get(string).datetime
+    def datetime(self, string: str) -> datetime.datetime:
+        return _parse_datetime(string)
 
-    def get_literal_name(self, item):
+    def get_literal_name(self, item) -> str:
         """Get name for item with fallback to literal attribute if name is not provided."""
-        name = item.find(self.qname('name'))
+        name = item.find(_TAG_NAME)
         return name.text if name is not None else item.attrib.get('literal')
 
 
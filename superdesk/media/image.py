@@ -11,30 +11,34 @@
 """Utilities for extractid metadata from image files."""
 
 import io
+import struct
 from PIL import Image, ExifTags
 from flask import json
 
 ORIENTATIONS = {
-    1: ("Normal", 0),
-    2: ("Mirrored left-to-right", 0),
-    3: ("Rotated 180 degrees", 180),
-    4: ("Mirrored top-to-bottom", 0),
-    5: ("Mirrored along top-left diagonal", 0),
-    6: ("Rotated 90 degrees", -90),
-    7: ("Mirrored along top-right diagonal", 0),
-    8: ("Rotated 270 degrees", -270)
+    1: ("Normal", None),
+    2: ("Mirrored left-to-right", None),
+    3: ("Rotated 180 degrees", Image.ROTATE_180),
+    4: ("Mirrored top-to-bottom", None),
+    5: ("Mirrored along top-left diagonal", None),
+    6: ("Rotated 90 degrees", Image.ROTATE_270),
+    7: ("Mirrored along top-right diagonal", None),
+    8: ("Rotated 270 degrees", Image.ROTATE_90)
 }
 EXIF_ORIENTATION_TAG = 274
 
 
-def fix_orientation(file_stream):
+def fix_orientation(file_stream, image=None):
     """Returns the image fixed accordingly to the orientation.
 
     @param file_stream: stream
+    @param image: already decoded PIL Image of the stream, avoids re-decoding
     """
     file_stream.seek(0)
-    img = Image.open(file_stream)
-    file_stream.seek(0)
+    if image is None:
+        image = Image.open(file_stream)
+        file_stream.seek(0)
+    img = image
     if not hasattr(img, '_getexif'):
         return file_stream
     rv = img._getexif()
@@ -44,8 +48,10 @@ def fix_orientation(file_stream):
     if exif.get(EXIF_ORIENTATION_TAG, None):
         orientation = exif.get(EXIF_ORIENTATION_TAG)
         if orientation in [3, 6, 8]:
-            degrees = ORIENTATIONS[orientation][1]
-            img2 = img.rotate(degrees)
+            # transpose is a plain memory shuffle, much cheaper than the
+            # resampling rotate() does, and it swaps the canvas size so
+            # 90/270 degree images are no longer cropped to the old canvas
+            img2 = img.transpose(ORIENTATIONS[orientation][1])
             output = io.BytesIO()
             img2.save(output, 'jpeg')
             output.seek(0)
@@ -53,14 +59,79 @@ def fix_orientation(file_stream):
     return file_stream
 
 
-def get_meta(file_stream):
-    """Returns the image metadata in a dictionary of tag:value pairs.
+def _tiff_orientation(tiff):
+    """Read the Orientation tag from a TIFF (EXIF) block.
+
+    @param tiff: EXIF payload bytes, starting at the TIFF header
+    @return: orientation value or None
+    """
+    byte_order = {b'II': '<', b'MM': '>'}.get(tiff[0:2])
+    if byte_order is None or len(tiff) < 8:
+        return None
+    (ifd_offset,) = struct.unpack(byte_order + 'I', tiff[4:8])
+    if ifd_offset + 2 > len(tiff):
+        return None
+    (count,) = struct.unpack(byte_order + 'H', tiff[ifd_offset:ifd_offset + 2])
+    for entry in range(count):
+        pos = ifd_offset + 2 + entry * 12
+        if pos + 12 > len(tiff):
+            return None
+        (tag,) = struct.unpack(byte_order + 'H', tiff[pos:pos + 2])
+        if tag == EXIF_ORIENTATION_TAG:
+            (value,) = struct.unpack(byte_order + 'H', tiff[pos + 8:pos + 10])
+            return value
+    return None
+
+
+def _exif_orientation(header):
+    """Find the EXIF Orientation value in a JPEG header without decoding.
+
+    @param header: leading bytes of the file
+    @return: orientation value or None if absent or not a JPEG
+    """
+    if header[0:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    end = len(header)
+    while offset + 4 <= end:
+        if header[offset] != 0xFF:
+            return None
+        marker = header[offset + 1]
+        (length,) = struct.unpack('>H', header[offset + 2:offset + 4])
+        if marker == 0xE1 and header[offset + 4:offset + 10] == b'Exif\x00\x00':
+            return _tiff_orientation(header[offset + 10:offset + 2 + length])
+        if marker == 0xDA:  # start of scan, no EXIF segment coming
+            return None
+        offset += 2 + length
+    return None
+
+
+def needs_orientation_fix(file_stream):
+    """Tell whether fix_orientation would actually rotate the image.
+
+    Peeks at the JPEG EXIF header with a plain marker scan, so the common
+    upright case is answered by a 64kB read instead of decoding the image.
 
     @param file_stream: stream
     """
     current = file_stream.tell()
     file_stream.seek(0)
-    img = Image.open(file_stream)
+    header = file_stream.read(65536)
+    file_stream.seek(current)
+    return _exif_orientation(header) in (3, 6, 8)
+
+
+def get_meta(file_stream, image=None):
+    """Returns the image metadata in a dictionary of tag:value pairs.
+
+    @param file_stream: stream
+    @param image: already decoded PIL Image of the stream, avoids re-decoding
+    """
+    current = file_stream.tell()
+    if image is None:
+        file_stream.seek(0)
+        image = Image.open(file_stream)
+    img = image
     if not hasattr(img, '_getexif'):
         return {}
     rv = img._getexif()
@@ -131,14 +131,15 @@ def process_video(content):
     return meta
 
 
-def process_image(content):
+def process_image(content, image=None):
     """Retrieves the image metadata
 
     :param BytesIO content: content stream
+    :param image: already decoded PIL Image of `content`, avoids re-decoding
     :return: dict image metadata
     """
     content.seek(0)
-    meta = get_meta(content)
+    meta = get_meta(content, image=image)
     content.seek(0)
     return meta
 
@@ -153,20 +154,23 @@ def _get_cropping_data(doc):
         return (int(doc['CropLeft']), int(doc['CropTop']), int(doc['CropRight']), int(doc['CropBottom']))
 
 
-def crop_image(content, file_name, cropping_data, exact_size=None, image_format=None):
+def crop_image(content, file_name, cropping_data, exact_size=None, image_format=None, image=None):
     """Crop image stream to given crop.
 
     :param content: image file stream
     :param file_name
     :param cropping_data: superdesk crop dict ({'CropLeft': 0, 'CropTop': 0, ...})
     :param exact_size: dict with `width` and `height` values
+    :param image: already decoded PIL Image of `content`, avoids re-decoding
     """
     if not isinstance(cropping_data, tuple):
         cropping_data = _get_cropping_data(cropping_data)
     if cropping_data:
         logger.debug('Opened image {} from stream, going to crop it'.format(file_name))
-        content.seek(0)
-        img = Image.open(content)
+        if image is None:
+            content.seek(0)
+            image = Image.open(content)
+        img = image
         cropped = img.crop(cropping_data)
         if exact_size and 'width' in exact_size and 'height' in exact_size:
             cropped = cropped.resize((int(exact_size['width']), int(exact_size['height'])), Image.ANTIALIAS)
@@ -10,9 +10,10 @@
 
 
 import os
+import datetime
 import unittest
 
-from xml.etree import ElementTree
+from lxml import etree
 from superdesk.io.feed_parsers.newsml_2_0 import NewsMLTwoFeedParser
 
 
@@ -23,7 +24,7 @@ class BaseNewMLTwoTestCase(unittest.TestCase):
         provider = {'name': 'Test'}
         with open(fixture, 'rb') as f:
             parser = NewsMLTwoFeedParser()
-            self.xml = ElementTree.parse(f)
+            self.xml = etree.parse(f)
             self.item = parser.parse(self.xml.getroot(), provider)
 
 
@@ -56,9 +57,27 @@ class ANSATestCase(BaseNewMLTwoTestCase):
         self.assertEqual('it', self.item[0]['language'])
 
 
+class StreamingParseTestCase(BaseNewMLTwoTestCase):
+    filename = 'tag:reuters.com,0000:newsml_L4N1FL0N0:1132689232'
+
+    def test_parse_stream_matches_tree_parse(self):
+        dirname = os.path.dirname(os.path.realpath(__file__))
+        fixture = os.path.normpath(os.path.join(dirname, '../fixtures', self.filename))
+        with open(fixture, 'rb') as f:
+            items = NewsMLTwoFeedParser().parse(f, {'name': 'Test'})
+        self.assertEqual(items, self.item)
+
+
 class ReutersOptaTestCase(BaseNewMLTwoTestCase):
     filename = 'tag:reuters.com,2018:newsml_MTZXEE13ZXCZES:2'
 
     def test_body(self):
         self.assertTrue(self.item[0].get('body_html').startswith('<pre>Jan 3 (OPTA) - Results and fixtures for the '
                                                                  'Primeira'))
+
+
+class DatetimeTestCase(unittest.TestCase):
+
+    def test_datetime_fixed_format(self):
+        self.assertEqual(NewsMLTwoFeedParser().datetime('2017-01-31T03:47:29.000Z'),
+                         datetime.datetime(2017, 1, 31, 3, 47, 29))
@@ -10,8 +10,10 @@
 
 
 import os
+import struct
+from io import BytesIO
 from unittest import TestCase
-from superdesk.media.image import get_meta
+from superdesk.media.image import get_meta, needs_orientation_fix
 from superdesk.media.media_operations import crop_image
 
 
@@ -73,6 +75,37 @@ class ExifMetaExtractionUserCommentRemovedTestCase(TestCase):
         self.assertIsNone(meta.get('UserComment', None))
 
 
+class NeedsOrientationFixTestCase(TestCase):
+
+    def jpeg_with_orientation(self, orientation):
+        """Build a minimal JPEG header carrying only an EXIF Orientation tag."""
+        tiff = b'II' + struct.pack('<HI', 42, 8)
+        tiff += struct.pack('<H', 1) + struct.pack('<HHIHH', 274, 3, 1, orientation, 0)
+        payload = b'Exif\x00\x00' + tiff
+        app1 = b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+        return BytesIO(b'\xff\xd8' + app1 + b'\xff\xd9')
+
+    def test_upright_fixtures_need_no_fix(self):
+        for name in ('canon_exif.JPG', 'iphone_gpsinfo_exif.JPG'):
+            with open(os.path.join(fixtures, name), mode='rb') as f:
+                self.assertFalse(needs_orientation_fix(f))
+
+    def test_rotated_orientations(self):
+        for orientation in (3, 6, 8):
+            self.assertTrue(needs_orientation_fix(self.jpeg_with_orientation(orientation)))
+        for orientation in (1, 2, 4, 5, 7):
+            self.assertFalse(needs_orientation_fix(self.jpeg_with_orientation(orientation)))
+
+    def test_non_jpeg_needs_no_fix(self):
+        self.assertFalse(needs_orientation_fix(BytesIO(b'\x89PNG\r\n\x1a\n')))
+
+    def test_stream_position_restored(self):
+        stream = self.jpeg_with_orientation(6)
+        stream.seek(2)
+        needs_orientation_fix(stream)
+        self.assertEqual(2, stream.tell())
+
+
 class MediaOperationsTestCase(TestCase):
 
     img = os.path.join(fixtures, 'canon_exif.JPG')
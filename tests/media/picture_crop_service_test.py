@@ -25,7 +25,7 @@ def get_file_mock(rendition, item):
     return data
 
 
-def crop_image_mock(content, file_name, cropping_data, exact_size=None, image_format=None):
+def crop_image_mock(content, file_name, cropping_data, exact_size=None, image_format=None, image=None):
     setattr(content, 'width', 1)
     setattr(content, 'height', 1)
     return True, content